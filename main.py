@@ -4,16 +4,33 @@ Pipedrive パイプライン自動レポート Slack 通知スクリプト
 
 指定されたパイプラインの全ステージの案件（企業）一覧を取得し、
 LLMでサマリを生成して、Slackに投稿する。
-- 親メッセージ: LLMによるパイプラインサマリ
-- スレッド: ステージごとの詳細リスト
+- メッセージ本文: LLMによるパイプラインサマリ + ステージごとの詳細リスト（Block Kit）
+- 1メッセージに収まらない場合は、ステージごとの詳細をスレッドに投稿
 """
 
+from __future__ import annotations
+
 import os
 import sys
+import json
+import time
+import hashlib
 import logging
-from typing import Dict, List, Set, Optional, Any
+import tempfile
+import functools
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Set, Optional, Any, Tuple
+import orjson
 import requests
-import google.generativeai as genai
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 # ログ設定
 logging.basicConfig(
@@ -22,50 +39,204 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 環境変数から設定を取得
-PIPEDRIVE_API_TOKEN = os.getenv('PIPEDRIVE_API_TOKEN')
-PIPELINE_ID = os.getenv('PIPELINE_ID')
-SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
-SLACK_CHANNEL = os.getenv('SLACK_CHANNEL')
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-
-# 後方互換性: SLACK_WEBHOOK_URLが設定されている場合はレガシーモード
-SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
-
 # Pipedrive API設定
 PIPEDRIVE_API_BASE = 'https://api.pipedrive.com/v1'
-
-
-def validate_env_vars():
-    """環境変数の検証"""
-    if not PIPEDRIVE_API_TOKEN:
+# v2 の /deals は pipeline_id での絞り込みに対応している（v1 の /deals は非対応）
+PIPEDRIVE_API_V2_BASE = 'https://api.pipedrive.com/api/v2'
+
+# HTTPセッション（Pipedrive / Slack への接続をプールして再利用する）
+# Accept-Encoding は requests の既定値を使う（brotli がインストールされていれば br も要求される）
+# 429 / 5xx は Retry-After ヘッダを尊重しつつ指数バックオフで最大3回リトライする
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET', 'POST'],
+        respect_retry_after_header=True
+    )
+))
+
+# Slack Web API
+SLACK_POST_MESSAGE_URL = 'https://slack.com/api/chat.postMessage'
+SLACK_RATELIMIT_MAX_RETRIES = 3
+
+# Slackへの投稿間隔（同一チャンネルへは約1件/秒が上限のため、送信前に間隔を空ける）
+SLACK_MIN_POST_INTERVAL_SECONDS = 1.0
+_last_slack_post_at = 0.0
+_slack_post_lock = threading.Lock()
+
+# /deals の1ページあたりの最大取得件数（Pipedrive APIの上限）
+DEALS_PAGE_LIMIT = 500
+
+# Slack chat.postMessage の上限（超える場合はスレッド返信にフォールバック）
+SLACK_MAX_BLOCKS = 50
+SLACK_MAX_SECTION_TEXT_LENGTH = 3000
+SLACK_MAX_MESSAGE_LENGTH = 40000
+
+# サマリ生成に使うGeminiモデル
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-lite'
+
+# Pipedrive レスポンス（ETag付き）のキャッシュ先の既定値
+DEFAULT_PIPEDRIVE_CACHE_DIR = Path.home() / '.cache' / 'pipedrive-slack'
+
+# Geminiレスポンスのディスクキャッシュの既定値（同一プロンプトの再実行時にAPI呼び出しを省略）
+# キャッシュ内容はそのままSlackへ投稿されるため、共有の一時ディレクトリではなくユーザー専用の場所に置く
+DEFAULT_GEMINI_CACHE_DIR = DEFAULT_PIPEDRIVE_CACHE_DIR / 'gemini'
+DEFAULT_GEMINI_CACHE_TTL_SECONDS = 86400
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """環境変数から読み込んだ実行設定"""
+    pipedrive_api_token: str
+    pipeline_id: str
+    mode: str  # 'enhanced' または 'legacy'
+    slack_bot_token: Optional[str] = None
+    slack_channel: Optional[str] = None
+    gemini_api_key: Optional[str] = None
+    # 後方互換性: SLACK_WEBHOOK_URLが設定されている場合はレガシーモード
+    slack_webhook_url: Optional[str] = None
+    gemini_cache_dir: Path = DEFAULT_GEMINI_CACHE_DIR
+    gemini_cache_ttl_seconds: int = DEFAULT_GEMINI_CACHE_TTL_SECONDS  # 0でキャッシュ無効
+    pipedrive_cache_dir: Path = DEFAULT_PIPEDRIVE_CACHE_DIR
+
+
+def validate_env_vars() -> Config:
+    """環境変数の検証と設定の読み込み"""
+    pipedrive_api_token = os.getenv('PIPEDRIVE_API_TOKEN')
+    pipeline_id = os.getenv('PIPELINE_ID')
+    slack_bot_token = os.getenv('SLACK_BOT_TOKEN')
+    slack_channel = os.getenv('SLACK_CHANNEL')
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    slack_webhook_url = os.getenv('SLACK_WEBHOOK_URL')
+    
+    if not pipedrive_api_token:
         logger.error('PIPEDRIVE_API_TOKEN が設定されていません')
         sys.exit(1)
-    if not PIPELINE_ID:
+    if not pipeline_id:
         logger.error('PIPELINE_ID が設定されていません')
         sys.exit(1)
     
     # 新モード: Slack Bot API + LLM
-    if SLACK_BOT_TOKEN and GEMINI_API_KEY:
-        if not SLACK_CHANNEL:
+    if slack_bot_token and gemini_api_key:
+        if not slack_channel:
             logger.error('SLACK_CHANNEL が設定されていません')
             sys.exit(1)
-        return 'enhanced'
-    
+        mode = 'enhanced'
     # レガシーモード: Webhook
-    if SLACK_WEBHOOK_URL:
+    elif slack_webhook_url:
         logger.info('レガシーモード: SLACK_WEBHOOK_URL を使用します（LLMサマリなし）')
-        return 'legacy'
+        mode = 'legacy'
+    else:
+        logger.error('SLACK_BOT_TOKEN + SLACK_CHANNEL + GEMINI_API_KEY、または SLACK_WEBHOOK_URL が必要です')
+        sys.exit(1)
+    
+    gemini_cache_ttl = os.getenv('GEMINI_CACHE_TTL_SECONDS') or str(DEFAULT_GEMINI_CACHE_TTL_SECONDS)
+    try:
+        gemini_cache_ttl_seconds = int(gemini_cache_ttl)
+    except ValueError:
+        logger.error('GEMINI_CACHE_TTL_SECONDS は整数で指定してください: %s', gemini_cache_ttl)
+        sys.exit(1)
     
-    logger.error('SLACK_BOT_TOKEN + SLACK_CHANNEL + GEMINI_API_KEY、または SLACK_WEBHOOK_URL が必要です')
-    sys.exit(1)
+    return Config(
+        pipedrive_api_token=pipedrive_api_token,
+        pipeline_id=pipeline_id,
+        mode=mode,
+        slack_bot_token=slack_bot_token,
+        slack_channel=slack_channel,
+        gemini_api_key=gemini_api_key,
+        slack_webhook_url=slack_webhook_url,
+        gemini_cache_dir=Path(os.getenv('GEMINI_CACHE_DIR') or DEFAULT_GEMINI_CACHE_DIR),
+        gemini_cache_ttl_seconds=gemini_cache_ttl_seconds,
+        pipedrive_cache_dir=Path(os.getenv('PIPEDRIVE_CACHE_DIR') or DEFAULT_PIPEDRIVE_CACHE_DIR)
+    )
+
+
+def write_json_atomic(path: Path, obj: Any) -> None:
+    """
+    JSONを一時ファイル経由でアトミックに書き込む
+    
+    Args:
+        path: 書き込み先のパス
+        obj: 書き込むオブジェクト
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
-def get_pipeline_stages(pipeline_id: str) -> List[Dict]:
+def decode_json(response: requests.Response) -> Any:
+    """
+    レスポンスボディをorjsonでデコード
+    
+    Args:
+        response: HTTPレスポンス
+        
+    Returns:
+        デコード結果
+        
+    Raises:
+        requests.exceptions.JSONDecodeError: JSONとして不正な場合（response.json() と同じ例外）
+    """
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
+        raise requests.exceptions.JSONDecodeError(str(e), response.text, 0) from e
+
+
+def load_cached_pipeline(config: Config, pipeline_id: str) -> Tuple[Optional[str], Optional[Dict]]:
+    """
+    前回取得したパイプライン情報とそのETagを取得
+    
+    Args:
+        config: 実行設定
+        pipeline_id: パイプラインID
+        
+    Returns:
+        (ETag, レスポンス) のタプル（キャッシュがない場合は (None, None)）
+    """
+    cache_path = config.pipedrive_cache_dir / f'pipeline_{pipeline_id}.json'
+    try:
+        with cache_path.open('r', encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached['etag'], cached['data']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+
+def save_cached_pipeline(config: Config, pipeline_id: str, etag: str, data: Dict) -> None:
+    """
+    パイプライン情報をETagとともにキャッシュに保存
+    
+    Args:
+        config: 実行設定
+        pipeline_id: パイプラインID
+        etag: レスポンスのETag
+        data: レスポンス
+    """
+    cache_path = config.pipedrive_cache_dir / f'pipeline_{pipeline_id}.json'
+    try:
+        write_json_atomic(cache_path, {'etag': etag, 'data': data})
+    except OSError as e:
+        logger.warning('パイプライン情報のキャッシュ保存に失敗: %s', e)
+
+
+def get_pipeline_stages(config: Config, pipeline_id: str) -> List[Dict]:
     """
     パイプラインのステージ一覧を取得
     
     Args:
+        config: 実行設定
         pipeline_id: パイプラインID
         
     Returns:
@@ -73,60 +244,75 @@ def get_pipeline_stages(pipeline_id: str) -> List[Dict]:
     """
     # まずパイプライン情報を取得してステージを取得する方法に戻す
     url = f'{PIPEDRIVE_API_BASE}/pipelines/{pipeline_id}'
-    params = {'api_token': PIPEDRIVE_API_TOKEN}
+    params = {'api_token': config.pipedrive_api_token}
+    
+    # 前回のETagを送り、変更がなければ 304 でキャッシュ済みのレスポンスを再利用する
+    cached_etag, cached_data = load_cached_pipeline(config, pipeline_id)
+    headers = {'If-None-Match': cached_etag} if cached_etag else {}
     
     try:
-        logger.info(f'パイプライン情報を取得中: pipeline_id={pipeline_id}')
-        response = requests.get(url, params=params, timeout=30)
+        logger.info('パイプライン情報を取得中: pipeline_id=%s', pipeline_id)
+        response = SESSION.get(url, params=params, headers=headers, timeout=30)
         response.raise_for_status()
-        data = response.json()
         
-        logger.debug(f'Pipedrive API レスポンス: {data}')
+        if response.status_code == 304 and cached_data is not None:
+            logger.info('パイプライン情報に変更がないため、キャッシュを使用します')
+            data = cached_data
+        else:
+            data = decode_json(response)
+            etag = response.headers.get('ETag')
+            if etag and data.get('success'):
+                save_cached_pipeline(config, pipeline_id, etag, data)
+        
+        logger.debug('Pipedrive API レスポンス: %s', data)
         
         if not data.get('success'):
             error_msg = data.get('error', 'Unknown error')
-            logger.error(f'Pipedrive API エラー: {error_msg}')
-            logger.error(f'レスポンス全体: {data}')
+            logger.error('Pipedrive API エラー: %s', error_msg)
+            logger.error('レスポンス全体: %s', data)
             sys.exit(1)
         
         pipeline_data = data.get('data')
         if not pipeline_data:
-            logger.error(f'パイプライン {pipeline_id} のデータが見つかりませんでした')
-            logger.error(f'レスポンス全体: {data}')
+            logger.error('パイプライン %s のデータが見つかりませんでした', pipeline_id)
+            logger.error('レスポンス全体: %s', data)
             sys.exit(1)
         
         # パイプライン情報からステージを取得
         stages = pipeline_data.get('stages', [])
         
         if not stages:
-            logger.warning(f'パイプライン {pipeline_id} にステージが見つかりませんでした')
-            logger.warning(f'パイプラインデータのキー: {list(pipeline_data.keys())}')
+            logger.warning('パイプライン %s にステージが見つかりませんでした', pipeline_id)
+            logger.warning('パイプラインデータのキー: %s', list(pipeline_data.keys()))
             # ステージが直接含まれていない場合、別の方法で取得を試みる
             logger.info('ステージがパイプライン情報に含まれていないため、/stagesエンドポイントから取得を試みます')
-            return get_stages_by_pipeline_id(pipeline_id)
+            return get_stages_by_pipeline_id(config, pipeline_id)
         
-        # ステージをorder_nrでソート
-        stages_sorted = sorted(stages, key=lambda x: x.get('order_nr', 0))
+        # ステージをorder_nrでソート（欠損時は0扱い）
+        for stage in stages:
+            stage.setdefault('order_nr', 0)
+        stages_sorted = sorted(stages, key=itemgetter('order_nr'))
         
-        logger.info(f'パイプライン {pipeline_id} から {len(stages_sorted)} 個のステージを取得')
+        logger.info('パイプライン %s から %d 個のステージを取得', pipeline_id, len(stages_sorted))
         for i, stage in enumerate(stages_sorted, 1):
-            logger.info(f'  ステージ {i}: id={stage.get("id")}, name={stage.get("name")}, order_nr={stage.get("order_nr")}')
+            logger.info('  ステージ %d: id=%s, name=%s, order_nr=%s', i, stage.get('id'), stage.get('name'), stage.get('order_nr'))
         
         return stages_sorted
         
     except requests.exceptions.RequestException as e:
-        logger.error(f'パイプライン情報の取得に失敗: {e}')
+        logger.error('パイプライン情報の取得に失敗: %s', e)
         if hasattr(e, 'response') and e.response is not None:
-            logger.error(f'レスポンスステータス: {e.response.status_code}')
-            logger.error(f'レスポンスボディ: {e.response.text}')
+            logger.error('レスポンスステータス: %s', e.response.status_code)
+            logger.error('レスポンスボディ: %s', e.response.text)
         sys.exit(1)
 
 
-def get_stages_by_pipeline_id(pipeline_id: str) -> List[Dict]:
+def get_stages_by_pipeline_id(config: Config, pipeline_id: str) -> List[Dict]:
     """
     /stagesエンドポイントからパイプラインIDでフィルタリングしてステージを取得
     
     Args:
+        config: 実行設定
         pipeline_id: パイプラインID
         
     Returns:
@@ -134,150 +320,229 @@ def get_stages_by_pipeline_id(pipeline_id: str) -> List[Dict]:
     """
     url = f'{PIPEDRIVE_API_BASE}/stages'
     params = {
-        'api_token': PIPEDRIVE_API_TOKEN,
+        'api_token': config.pipedrive_api_token,
         'pipeline_id': pipeline_id
     }
     
     try:
-        logger.info(f'/stagesエンドポイントからステージ情報を取得中: pipeline_id={pipeline_id}')
-        response = requests.get(url, params=params, timeout=30)
+        logger.info('/stagesエンドポイントからステージ情報を取得中: pipeline_id=%s', pipeline_id)
+        response = SESSION.get(url, params=params, timeout=30)
         response.raise_for_status()
-        data = response.json()
+        data = decode_json(response)
         
-        logger.debug(f'Pipedrive API レスポンス: {data}')
+        logger.debug('Pipedrive API レスポンス: %s', data)
         
         if not data.get('success'):
             error_msg = data.get('error', 'Unknown error')
-            logger.error(f'Pipedrive API エラー: {error_msg}')
-            logger.error(f'レスポンス全体: {data}')
+            logger.error('Pipedrive API エラー: %s', error_msg)
+            logger.error('レスポンス全体: %s', data)
             return []
         
         stages = data.get('data', [])
         
         if not stages:
-            logger.warning(f'パイプライン {pipeline_id} にステージが見つかりませんでした')
+            logger.warning('パイプライン %s にステージが見つかりませんでした', pipeline_id)
             return []
         
-        # ステージをorder_nrでソート
-        stages_sorted = sorted(stages, key=lambda x: x.get('order_nr', 0))
+        # ステージをorder_nrでソート（欠損時は0扱い）
+        for stage in stages:
+            stage.setdefault('order_nr', 0)
+        stages_sorted = sorted(stages, key=itemgetter('order_nr'))
         
-        logger.info(f'/stagesエンドポイントから {len(stages_sorted)} 個のステージを取得')
+        logger.info('/stagesエンドポイントから %d 個のステージを取得', len(stages_sorted))
         for i, stage in enumerate(stages_sorted, 1):
-            logger.info(f'  ステージ {i}: id={stage.get("id")}, name={stage.get("name")}, order_nr={stage.get("order_nr")}')
+            logger.info('  ステージ %d: id=%s, name=%s, order_nr=%s', i, stage.get('id'), stage.get('name'), stage.get('order_nr'))
         
         return stages_sorted
         
     except requests.exceptions.RequestException as e:
-        logger.error(f'/stagesエンドポイントからの取得に失敗: {e}')
+        logger.error('/stagesエンドポイントからの取得に失敗: %s', e)
         if hasattr(e, 'response') and e.response is not None:
-            logger.error(f'レスポンスステータス: {e.response.status_code}')
-            logger.error(f'レスポンスボディ: {e.response.text}')
+            logger.error('レスポンスステータス: %s', e.response.status_code)
+            logger.error('レスポンスボディ: %s', e.response.text)
         return []
 
 
-def get_deals_by_stage(pipeline_id: str, stage_id: str) -> List[Dict]:
+def iter_all_open_deals(config: Config, pipeline_id: str) -> Iterator[Dict]:
     """
-    指定ステージのopenなDeal一覧を取得
+    パイプライン内のopenなDealをページ単位で取得しながら逐次返す
+    
+    全件をリストに溜め込まず、取得したページから順に呼び出し側で処理できる。
+    取得に失敗した場合は、不完全なレポートを投稿しないようエラーをログ出力して終了する。
     
     Args:
+        config: 実行設定
         pipeline_id: パイプラインID
-        stage_id: ステージID
         
-    Returns:
-        Deal情報のリスト
+    Yields:
+        Deal情報
     """
-    url = f'{PIPEDRIVE_API_BASE}/deals'
+    url = f'{PIPEDRIVE_API_V2_BASE}/deals'
     params = {
-        'api_token': PIPEDRIVE_API_TOKEN,
+        'api_token': config.pipedrive_api_token,
         'pipeline_id': pipeline_id,
-        'stage_id': stage_id,
         'status': 'open',
-        'limit': 500  # 最大取得件数
+        'limit': DEALS_PAGE_LIMIT
     }
+    total = 0
     
     try:
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if not data.get('success'):
-            error_msg = data.get('error', 'Unknown error')
-            logger.error(f'Pipedrive API エラー (stage_id: {stage_id}): {error_msg}')
-            return []
-        
-        deals = data.get('data')
-        
-        # dataがNoneの場合やリストでない場合は空リストを返す
-        if deals is None:
-            logger.warning(f'ステージ {stage_id} のDealデータがNoneです')
-            return []
-        
-        if not isinstance(deals, list):
-            logger.warning(f'ステージ {stage_id} のDealデータがリストではありません: {type(deals)}')
-            return []
+        while True:
+            response = SESSION.get(url, params=params, timeout=30)
+            response.raise_for_status()
+            data = decode_json(response)
+            
+            if not data.get('success'):
+                error_msg = data.get('error', 'Unknown error')
+                logger.error('Pipedrive API エラー (pipeline_id: %s): %s', pipeline_id, error_msg)
+                logger.error('レスポンス全体: %s', data)
+                sys.exit(1)
+            
+            page = data.get('data')
+            
+            # dataがNoneの場合（該当なし）はそこで終了
+            if page is None:
+                break
+            
+            if not isinstance(page, list):
+                logger.error('パイプライン %s のDealデータがリストではありません: %s', pipeline_id, type(page))
+                sys.exit(1)
+            
+            total += len(page)
+            logger.debug('Dealページ取得: cursor=%s, %d 件 (Content-Encoding: %s)',
+                         params.get('cursor'), len(page), response.headers.get('Content-Encoding'))
+            yield from page
+            
+            # v2 はカーソル方式のページング（next_cursor がなければ最終ページ）
+            next_cursor = (data.get('additional_data') or {}).get('next_cursor')
+            if not next_cursor:
+                break
+            params['cursor'] = next_cursor
         
-        logger.info(f'ステージ {stage_id} から {len(deals)} 件のDealを取得')
-        return deals
+        logger.info('パイプライン %s から %d 件のopenなDealを取得', pipeline_id, total)
         
     except requests.exceptions.RequestException as e:
-        logger.error(f'Deal情報の取得に失敗 (stage_id: {stage_id}): {e}')
+        logger.error('Deal情報の取得に失敗 (pipeline_id: %s): %s', pipeline_id, e)
         if hasattr(e, 'response') and e.response is not None:
-            logger.error(f'レスポンスステータス: {e.response.status_code}')
-            logger.error(f'レスポンスボディ: {e.response.text}')
-        return []
+            logger.error('レスポンスステータス: %s', e.response.status_code)
+            logger.error('レスポンスボディ: %s', e.response.text)
+        sys.exit(1)
 
 
-def group_companies_by_stage(pipeline_id: str, stages: List[Dict]) -> Dict[str, List[str]]:
+def group_companies_by_stage(config: Config, pipeline_id: str, stages: List[Dict]) -> Dict[str, List[str]]:
     """
     ステージごとに企業名をグルーピング
     
     Args:
+        config: 実行設定
         pipeline_id: パイプラインID
         stages: ステージ情報のリスト
         
     Returns:
         ステージ名をキー、企業名のリスト（ソート済み）を値とする辞書
     """
-    stage_companies: Dict[str, List[str]] = {}
+    logger.info('パイプライン内のDeal取得を開始: %d ステージ', len(stages))
+    
+    # openなDealをページ単位で逐次取得し、stage_idごとにローカルで振り分ける
+    # 企業名はsetで重複除外し、titleが空のDealは除く
+    buckets: Dict[Any, Set[str]] = defaultdict(set)
+    for deal in iter_all_open_deals(config, pipeline_id):
+        title = (deal.get('title') or '').strip()
+        if title:
+            buckets[deal.get('stage_id')].add(title)
     
-    logger.info(f'ステージごとのDeal取得を開始: {len(stages)} ステージ')
+    stage_companies: Dict[str, List[str]] = {}
     
     for stage in stages:
-        stage_id = str(stage.get('id'))
         stage_name = stage.get('name', '不明')
-        
-        logger.info(f'ステージ "{stage_name}" (id: {stage_id}) のDealを取得中...')
-        deals = get_deals_by_stage(pipeline_id, stage_id)
-        companies = set()
-        
-        for deal in deals:
-            title = deal.get('title', '').strip()
-            if title:
-                companies.add(title)
-            else:
-                logger.debug(f'Deal id={deal.get("id")} のtitleが空です')
+        companies = buckets.get(stage.get('id'), set())
         
         stage_companies[stage_name] = sorted(companies)
-        logger.info(f'ステージ "{stage_name}": {len(companies)} 社')
-        if companies:
-            logger.debug(f'  企業名: {sorted(companies)}')
+        logger.info('ステージ "%s": %d 社', stage_name, len(companies))
+        if companies and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('  企業名: %s', ', '.join(stage_companies[stage_name]))
     
     return stage_companies
 
 
-def generate_pipeline_summary(stage_companies: Dict[str, List[str]]) -> str:
+@functools.lru_cache(maxsize=4)
+def _get_model(name: str, api_key: str) -> genai.GenerativeModel:
+    """
+    Geminiモデルを初期化して返す（モデル名・APIキーごとに1度だけ生成してキャッシュ）
+    
+    Args:
+        name: モデル名
+        api_key: Gemini APIキー
+        
+    Returns:
+        GenerativeModelインスタンス
+    """
+    # SDKの読み込みが重いため、サマリ生成時（新モード）にのみimportする
+    import google.generativeai as genai
+    
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(name)
+
+
+def _summary_cache_path(config: Config, prompt: str) -> Path:
+    """モデル名とプロンプトのハッシュからキャッシュファイルのパスを算出"""
+    key = hashlib.blake2b(f'{GEMINI_MODEL_NAME}\n{prompt}'.encode('utf-8'), digest_size=16).hexdigest()
+    return config.gemini_cache_dir / f'{key}.json'
+
+
+def load_cached_summary(config: Config, prompt: str) -> Optional[str]:
+    """
+    キャッシュ済みのサマリを取得（TTL切れ・未キャッシュの場合はNone）
+    
+    Args:
+        config: 実行設定
+        prompt: Geminiに送信するプロンプト
+        
+    Returns:
+        キャッシュ済みのサマリテキスト
+    """
+    if config.gemini_cache_ttl_seconds <= 0:
+        return None
+    
+    cache_path = _summary_cache_path(config, prompt)
+    try:
+        if time.time() - cache_path.stat().st_mtime >= config.gemini_cache_ttl_seconds:
+            return None
+        with cache_path.open('r', encoding='utf-8') as f:
+            return json.load(f).get('summary')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def save_cached_summary(config: Config, prompt: str, summary: str) -> None:
+    """
+    サマリをキャッシュに保存（一時ファイル経由でアトミックに書き込む）
+    
+    Args:
+        config: 実行設定
+        prompt: Geminiに送信したプロンプト
+        summary: 生成されたサマリテキスト
+    """
+    if config.gemini_cache_ttl_seconds <= 0:
+        return
+    
+    try:
+        write_json_atomic(_summary_cache_path(config, prompt), {'summary': summary})
+    except OSError as e:
+        logger.warning('サマリのキャッシュ保存に失敗: %s', e)
+
+
+def generate_pipeline_summary(config: Config, stage_companies: Dict[str, List[str]]) -> str:
     """
     LLM（Gemini）を使ってパイプラインのサマリを生成
     
     Args:
+        config: 実行設定
         stage_companies: ステージ名をキー、企業名のリストを値とする辞書
         
     Returns:
         生成されたサマリテキスト
     """
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.5-flash-lite')
-    
     # パイプラインデータを整形
     pipeline_data_text = []
     total_companies = 0
@@ -289,6 +554,11 @@ def generate_pipeline_summary(stage_companies: Dict[str, List[str]]) -> str:
         if companies:
             pipeline_data_text.append(f"  企業: {', '.join(companies)}")
     
+    # 案件が1件もない場合は分析対象がないため、Geminiを呼び出さずに定型文を返す
+    if total_companies == 0:
+        logger.info('案件がないため、サマリ生成をスキップします')
+        return '本日のパイプラインに案件はありません。'
+    
     pipeline_info = "\n".join(pipeline_data_text)
     
     prompt = f"""以下は営業パイプラインの現在の状況です。このデータを分析し、営業チーム向けの具体的なサマリを日本語で作成してください。
@@ -319,16 +589,23 @@ def generate_pipeline_summary(stage_companies: Dict[str, List[str]]) -> str:
 - 絵文字を適度に使って親しみやすく
 - 【】で囲まれた見出しは必ず *【〇〇】* の形式で太字にする
 - 400文字程度に収める
-- 詳細はスレッドにあるので「詳細はスレッドをご確認ください」と最後に添える
+- ステージごとの詳細は別途一覧で共有されるので「詳細はステージ別一覧をご確認ください」と最後に添える
 
 サマリを出力してください（サマリ本文のみ、前置きや説明は不要）:"""
 
+    cached_summary = load_cached_summary(config, prompt)
+    if cached_summary:
+        logger.info('キャッシュ済みのサマリを使用: %d 文字', len(cached_summary))
+        return cached_summary
+    
     logger.info('Gemini APIでサマリを生成中...')
     
-    response = model.generate_content(prompt)
+    response = _get_model(GEMINI_MODEL_NAME, config.gemini_api_key).generate_content(prompt)
     
     summary = response.text.strip()
-    logger.info(f'サマリ生成完了: {len(summary)} 文字')
+    logger.info('サマリ生成完了: %d 文字', len(summary))
+    
+    save_cached_summary(config, prompt, summary)
     
     return summary
 
@@ -351,11 +628,83 @@ def format_stage_detail(stage_name: str, companies: List[str]) -> str:
         return f"*【{stage_name}】* (0社)\n該当なし"
 
 
-def send_to_slack_with_thread(summary: str, stage_companies: Dict[str, List[str]]) -> bool:
+def wait_for_slack_rate_limit() -> None:
+    """前回のSlack投稿から SLACK_MIN_POST_INTERVAL_SECONDS 経過するまで待機"""
+    global _last_slack_post_at
+    with _slack_post_lock:
+        wait = SLACK_MIN_POST_INTERVAL_SECONDS - (time.monotonic() - _last_slack_post_at)
+        if wait > 0:
+            time.sleep(wait)
+        _last_slack_post_at = time.monotonic()
+
+
+def post_slack_message(headers: Dict[str, str], payload: Dict) -> Dict:
     """
-    Slack Bot APIでサマリを送信し、スレッドに詳細を投稿
+    chat.postMessage を呼び出す（ratelimited エラー時は Retry-After 秒待って再送）
     
     Args:
+        headers: リクエストヘッダ
+        payload: 送信するペイロード
+        
+    Returns:
+        Slack APIのレスポンス
+    """
+    body = orjson.dumps(payload)
+    
+    for attempt in range(SLACK_RATELIMIT_MAX_RETRIES + 1):
+        wait_for_slack_rate_limit()
+        response = SESSION.post(
+            SLACK_POST_MESSAGE_URL,
+            headers=headers,
+            data=body,
+            timeout=30
+        )
+        response.raise_for_status()
+        data = decode_json(response)
+        
+        if data.get('ok') or data.get('error') != 'ratelimited' or attempt == SLACK_RATELIMIT_MAX_RETRIES:
+            return data
+        
+        retry_after = int(response.headers.get('Retry-After', 2 ** attempt))
+        logger.warning('Slack API レート制限: %s 秒後に再送します (%s/%s)', retry_after, attempt + 1, SLACK_RATELIMIT_MAX_RETRIES)
+        time.sleep(retry_after)
+    
+    return data
+
+
+def build_message_blocks(parent_message: str, stage_details: List[str]) -> Optional[List[Dict]]:
+    """
+    サマリとステージ詳細を1メッセージにまとめるBlock Kitのblocksを組み立てる
+    
+    Args:
+        parent_message: サマリメッセージ
+        stage_details: ステージごとの詳細メッセージ
+        
+    Returns:
+        blocksのリスト（Slackの上限を超える場合はNone）
+    """
+    texts = [parent_message, *stage_details]
+    
+    if len(texts) + 1 > SLACK_MAX_BLOCKS:
+        return None
+    if any(len(text) > SLACK_MAX_SECTION_TEXT_LENGTH for text in texts):
+        return None
+    if sum(len(text) for text in texts) > SLACK_MAX_MESSAGE_LENGTH:
+        return None
+    
+    sections = [{'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}} for text in texts]
+    return [sections[0], {'type': 'divider'}, *sections[1:]]
+
+
+def send_to_slack_with_thread(config: Config, summary: str, stage_companies: Dict[str, List[str]]) -> bool:
+    """
+    Slack Bot APIでサマリとステージ詳細を1メッセージで送信
+    
+    Slackの上限（blocks数・文字数）を超える場合は、サマリを送信した上で
+    スレッドにステージごとの詳細を投稿する
+    
+    Args:
+        config: 実行設定
         summary: LLM生成のサマリ
         stage_companies: ステージ別の企業リスト
         
@@ -363,7 +712,7 @@ def send_to_slack_with_thread(summary: str, stage_companies: Dict[str, List[str]
         送信成功時True
     """
     headers = {
-        'Authorization': f'Bearer {SLACK_BOT_TOKEN}',
+        'Authorization': f'Bearer {config.slack_bot_token}',
         'Content-Type': 'application/json'
     }
     
@@ -373,67 +722,63 @@ def send_to_slack_with_thread(summary: str, stage_companies: Dict[str, List[str]
     # 親メッセージ: サマリ
     parent_message = f"📊 *本日のNEWT Chat パイプライン状況* ({total_companies}社)\n\n{summary}"
     
+    stage_details = [
+        format_stage_detail(stage_name, companies)
+        for stage_name, companies in stage_companies.items()
+    ]
+    blocks = build_message_blocks(parent_message, stage_details)
+    
     payload = {
-        'channel': SLACK_CHANNEL,
+        'channel': config.slack_channel,
         'text': parent_message,
         'unfurl_links': False,
         'unfurl_media': False
     }
+    if blocks:
+        payload['blocks'] = blocks
     
     try:
         # 親メッセージを送信
         logger.info('サマリメッセージを送信中...')
-        response = requests.post(
-            'https://slack.com/api/chat.postMessage',
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
+        data = post_slack_message(headers, payload)
         
         if not data.get('ok'):
-            logger.error(f'Slack API エラー: {data.get("error")}')
+            logger.error('Slack API エラー: %s', data.get('error'))
             return False
         
         thread_ts = data.get('ts')
-        logger.info(f'サマリメッセージ送信完了: ts={thread_ts}')
+        logger.info('サマリメッセージ送信完了: ts=%s', thread_ts)
         
-        # スレッドに詳細を投稿
+        if blocks:
+            logger.info('Slackへの投稿が完了しました（ステージ詳細を同一メッセージに掲載）')
+            return True
+        
+        # 1メッセージに収まらないため、スレッドに詳細を投稿
         logger.info('スレッドに詳細を投稿中...')
-        for stage_name, companies in stage_companies.items():
-            detail_message = format_stage_detail(stage_name, companies)
-            
+        for stage_name, detail_message in zip(stage_companies, stage_details):
             thread_payload = {
-                'channel': SLACK_CHANNEL,
+                'channel': config.slack_channel,
                 'text': detail_message,
                 'thread_ts': thread_ts,
                 'unfurl_links': False,
                 'unfurl_media': False
             }
             
-            thread_response = requests.post(
-                'https://slack.com/api/chat.postMessage',
-                headers=headers,
-                json=thread_payload,
-                timeout=30
-            )
-            thread_response.raise_for_status()
-            thread_data = thread_response.json()
+            thread_data = post_slack_message(headers, thread_payload)
             
             if not thread_data.get('ok'):
-                logger.warning(f'スレッド投稿エラー ({stage_name}): {thread_data.get("error")}')
+                logger.warning('スレッド投稿エラー (%s): %s', stage_name, thread_data.get('error'))
             else:
-                logger.info(f'  ステージ "{stage_name}" の詳細を投稿')
+                logger.info('  ステージ "%s" の詳細を投稿', stage_name)
         
         logger.info('Slackへの投稿が完了しました')
         return True
         
     except requests.exceptions.RequestException as e:
-        logger.error(f'Slackへの投稿に失敗: {e}')
+        logger.error('Slackへの投稿に失敗: %s', e)
         if hasattr(e, 'response') and e.response is not None:
-            logger.error(f'レスポンスステータス: {e.response.status_code}')
-            logger.error(f'レスポンスボディ: {e.response.text}')
+            logger.error('レスポンスステータス: %s', e.response.status_code)
+            logger.error('レスポンスボディ: %s', e.response.text)
         return False
 
 
@@ -447,28 +792,21 @@ def format_slack_message_legacy(stage_companies: Dict[str, List[str]]) -> str:
     Returns:
         フォーマット済みメッセージ
     """
-    message_parts = ['本日のNEWT Chat パイプライン状況（※敬称略）\n']
-    
-    for stage_name, companies in stage_companies.items():
-        message_parts.append(f'【{stage_name}】')
-        
-        if companies:
-            # 企業名をソートして表示
-            companies_line = ' / '.join(companies)
-            message_parts.append(f'・{companies_line}')
-        else:
-            message_parts.append('・該当なし')
-        
-        message_parts.append('')  # 空行
-    
-    return '\n'.join(message_parts)
+    # ステージごとのセクションを生成し、ヘッダとともに1回のjoinで連結する
+    # （企業名はソート済みのものをそのまま表示）
+    sections = (
+        f'【{stage_name}】\n・{" / ".join(companies) if companies else "該当なし"}\n'
+        for stage_name, companies in stage_companies.items()
+    )
+    return '\n'.join(['本日のNEWT Chat パイプライン状況（※敬称略）\n', *sections])
 
 
-def send_to_slack_legacy(message: str) -> bool:
+def send_to_slack_legacy(config: Config, message: str) -> bool:
     """
     レガシーモード: Slack Incoming Webhookにメッセージを送信
     
     Args:
+        config: 実行設定
         message: 送信するメッセージ
         
     Returns:
@@ -477,15 +815,22 @@ def send_to_slack_legacy(message: str) -> bool:
     payload = {'text': message}
     
     # デバッグ: メッセージ内容をログ出力（機密情報は含まない）
-    logger.info(f'Slackに送信するメッセージ長: {len(message)} 文字')
-    logger.debug(f'メッセージ内容: {message[:200]}...' if len(message) > 200 else f'メッセージ内容: {message}')
+    logger.info('Slackに送信するメッセージ長: %d 文字', len(message))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('メッセージ内容: %s', f'{message[:200]}...' if len(message) > 200 else message)
     
     try:
-        response = requests.post(SLACK_WEBHOOK_URL, json=payload, timeout=30)
+        wait_for_slack_rate_limit()
+        response = SESSION.post(
+            config.slack_webhook_url,
+            headers={'Content-Type': 'application/json'},
+            data=orjson.dumps(payload),
+            timeout=30
+        )
         
         # レスポンスの詳細をログ出力
-        logger.info(f'Slack API レスポンス: ステータスコード={response.status_code}')
-        logger.debug(f'レスポンスボディ: {response.text}')
+        logger.info('Slack API レスポンス: ステータスコード=%s', response.status_code)
+        logger.debug('レスポンスボディ: %s', response.text)
         
         response.raise_for_status()
         
@@ -494,14 +839,14 @@ def send_to_slack_legacy(message: str) -> bool:
             logger.info('Slackへの投稿に成功')
             return True
         else:
-            logger.warning(f'Slack APIが予期しないレスポンスを返しました: {response.text}')
+            logger.warning('Slack APIが予期しないレスポンスを返しました: %s', response.text)
             return True  # ステータスコードが200なら成功とみなす
         
     except requests.exceptions.RequestException as e:
-        logger.error(f'Slackへの投稿に失敗: {e}')
+        logger.error('Slackへの投稿に失敗: %s', e)
         if hasattr(e, 'response') and e.response is not None:
-            logger.error(f'レスポンスステータス: {e.response.status_code}')
-            logger.error(f'レスポンスボディ: {e.response.text}')
+            logger.error('レスポンスステータス: %s', e.response.status_code)
+            logger.error('レスポンスボディ: %s', e.response.text)
         return False
 
 
@@ -510,11 +855,12 @@ def main():
     logger.info('Pipedrive パイプライン自動レポート処理を開始')
     
     # 環境変数の検証
-    mode = validate_env_vars()
-    logger.info(f'動作モード: {mode}')
+    config = validate_env_vars()
+    mode = config.mode
+    logger.info('動作モード: %s', mode)
     
     # パイプラインのステージ一覧を取得
-    stages = get_pipeline_stages(PIPELINE_ID)
+    stages = get_pipeline_stages(config, config.pipeline_id)
     
     if not stages:
         logger.error('ステージが見つかりませんでした。以下を確認してください:')
@@ -524,19 +870,19 @@ def main():
         sys.exit(1)
     
     # ステージごとに企業名をグルーピング
-    stage_companies = group_companies_by_stage(PIPELINE_ID, stages)
+    stage_companies = group_companies_by_stage(config, config.pipeline_id, stages)
     
     if mode == 'enhanced':
-        # 新モード: LLMサマリ + スレッド返信
+        # 新モード: LLMサマリ + ステージ詳細（必要に応じてスレッド返信）
         try:
-            summary = generate_pipeline_summary(stage_companies)
+            summary = generate_pipeline_summary(config, stage_companies)
         except Exception as e:
-            logger.error(f'サマリ生成に失敗: {e}')
+            logger.error('サマリ生成に失敗: %s', e)
             # フォールバック: シンプルなサマリ
             total = sum(len(c) for c in stage_companies.values())
-            summary = f"本日のパイプラインには合計 {total} 社の案件があります。詳細はスレッドをご確認ください。"
+            summary = f"本日のパイプラインには合計 {total} 社の案件があります。詳細はステージ別一覧をご確認ください。"
         
-        if send_to_slack_with_thread(summary, stage_companies):
+        if send_to_slack_with_thread(config, summary, stage_companies):
             logger.info('処理が正常に完了しました')
             sys.exit(0)
         else:
@@ -545,9 +891,9 @@ def main():
     else:
         # レガシーモード: Webhook
         message = format_slack_message_legacy(stage_companies)
-        logger.info(f'フォーマット済みメッセージ: {len(message)} 文字')
+        logger.info('フォーマット済みメッセージ: %d 文字', len(message))
         
-        if send_to_slack_legacy(message):
+        if send_to_slack_legacy(config, message):
             logger.info('処理が正常に完了しました')
             sys.exit(0)
         else:
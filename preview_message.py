@@ -1,13 +1,13 @@
-from main import format_slack_message
+from main import format_slack_message_legacy
 
 # Mock data
 stage_companies = {
-    'リード': {'株式会社A', '株式会社B'},
-    '商談中': {'株式会社C'},
-    '契約完了': set()
+    'リード': ['株式会社A', '株式会社B'],
+    '商談中': ['株式会社C'],
+    '契約完了': []
 }
 
 # Generate message
-message = format_slack_message(stage_companies)
+message = format_slack_message_legacy(stage_companies)
 
 print(message)
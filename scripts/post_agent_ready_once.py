@@ -10,15 +10,30 @@ Usage: ensure the following environment variables are set
 Optional environment variables
     AGENT_READY_STAGE_NAME (default: agent調整完了)
     OWNER_SLACK_MAP_PATH (default: config/owner_slack_map.yaml)
+    STAGE_ID_CACHE_PATH (default: config/.stage_id_cache.json)
+    LAST_SLACK_HASH_PATH (default: config/.last_slack_hash)
 """
 
 import os
 import sys
 import json
+import time
+import hashlib
 import requests
+import yaml
 
 PIPEDRIVE_API_BASE = 'https://api.pipedrive.com/v1'
 
+# Only the deal fields main() reads; v1 reports the owner under user_id.
+DEAL_FIELDS = ('id', 'title', 'user_id')
+
+# Resolved stage ids are reused for a day before asking Pipedrive again.
+STAGE_ID_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# One keep-alive session so the stage lookup and the deals fetch share a TLS connection.
+SESSION = requests.Session()
+SESSION.mount('https://', requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=2))
+
 
 def env(name, default=None, required=False):
     value = os.getenv(name, default)
@@ -28,31 +43,63 @@ def env(name, default=None, required=False):
     return value
 
 
+def write_json_atomic(path, obj):
+    """Write obj as JSON via a temp file so readers never see a partial file."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 def load_owner_map(path):
     if not os.path.exists(path):
         print(f'Owner map file not found: {path}', file=sys.stderr)
         return {}
 
-    owner_map = {}
-    with open(path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            if ':' not in line:
-                continue
-            key, value = line.split(':', 1)
-            key = key.strip()
-            value = value.split('#', 1)[0].strip()
-            if key and value:
-                owner_map[key] = value
+    # A JSON sidecar newer than the YAML skips YAML parsing entirely.
+    cache_path = path + '.cache.json'
+    try:
+        if os.path.getmtime(cache_path) > os.path.getmtime(path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            # Anything but a mapping means a damaged sidecar: re-parse the YAML.
+            if isinstance(cached, dict):
+                return cached
+    except (OSError, ValueError):
+        pass
+
+    # Use libyaml's C loader when available; fall back to the pure-Python one.
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.load(f, Loader=loader) or {}
+    except yaml.YAMLError as e:
+        print(f'Owner map file is not valid YAML: {path}: {e}', file=sys.stderr)
+        return {}
+    if not isinstance(data, dict):
+        print(f'Owner map file is not a mapping: {path}', file=sys.stderr)
+        return {}
+    owner_map = {str(k): str(v) for k, v in data.items() if k is not None and v}
+
+    # Best effort: a read-only checkout simply keeps parsing the YAML.
+    try:
+        write_json_atomic(cache_path, owner_map)
+    except OSError:
+        pass
     return owner_map
 
 
 def fetch_stages(pipeline_id, token):
     url = f'{PIPEDRIVE_API_BASE}/pipelines/{pipeline_id}'
     params = {'api_token': token}
-    resp = requests.get(url, params=params, timeout=30)
+    resp = SESSION.get(url, params=params, timeout=30)
     resp.raise_for_status()
     data = resp.json()
     if not data.get('success'):
@@ -69,16 +116,50 @@ def find_stage_id(stage_name, pipeline_id, token):
     raise RuntimeError(f'Stage "{stage_name}" not found in pipeline {pipeline_id}')
 
 
-def fetch_deals(pipeline_id, stage_id, token):
-    url = f'{PIPEDRIVE_API_BASE}/deals'
+def resolve_stage_id(stage_name, pipeline_id, token, cache_path):
+    """
+    Look up the stage id through a small on-disk cache keyed by pipeline and
+    stage name, so warm runs skip the /pipelines request entirely.
+    """
+    key = f'{pipeline_id}:{stage_name}'
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict):
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+
+    # Only trust a well-formed entry: a missing stage_id would drop the stage
+    # filter from fetch_deals and match unrelated deals.
+    entry = cache.get(key)
+    if isinstance(entry, dict):
+        stage_id = entry.get('stage_id')
+        cached_at = entry.get('cached_at')
+        if (isinstance(stage_id, int) and not isinstance(stage_id, bool)
+                and isinstance(cached_at, (int, float)) and not isinstance(cached_at, bool)
+                and time.time() - cached_at < STAGE_ID_CACHE_TTL_SECONDS):
+            return stage_id
+
+    stage_id = find_stage_id(stage_name, pipeline_id, token)
+    cache[key] = {'stage_id': stage_id, 'cached_at': time.time()}
+    try:
+        write_json_atomic(cache_path, cache)
+    except OSError:
+        pass
+    return stage_id
+
+
+def fetch_deals(pipeline_id, stage_id, token, limit=500):
+    url = f'{PIPEDRIVE_API_BASE}/deals:({",".join(DEAL_FIELDS)})'
     params = {
         'pipeline_id': pipeline_id,
         'stage_id': stage_id,
         'status': 'open',
-        'limit': 500,
+        'limit': limit,
         'api_token': token
     }
-    resp = requests.get(url, params=params, timeout=30)
+    resp = SESSION.get(url, params=params, timeout=30)
     resp.raise_for_status()
     data = resp.json()
     if not data.get('success'):
@@ -89,9 +170,12 @@ def fetch_deals(pipeline_id, stage_id, token):
 def extract_owner_id(deal):
     """
     Pipedrive deals sometimes include owner info under deal['owner_id']
-    or deal['user_id'] (both can be dicts). Fall back to whichever is available.
+    or deal['user_id'] (both can be dicts). Fall back to user_id only when
+    owner_id is absent, so a falsy but present owner_id (e.g. 0) is kept.
     """
-    owner_obj = deal.get('owner_id') or deal.get('user_id')
+    owner_obj = deal.get('owner_id')
+    if owner_obj is None:
+        owner_obj = deal.get('user_id')
     if owner_obj is None:
         return None
     if isinstance(owner_obj, dict):
@@ -110,17 +194,39 @@ def format_owner(deal, owner_map):
     return f'owner_id {owner_id}'
 
 
-def post_to_slack(webhook_url, text):
+def post_to_slack(webhook_url, text, last_hash_path=None):
+    """
+    Post text to the webhook. When last_hash_path is given, skip the POST if
+    the same text was the last one successfully delivered. Returns True if a
+    message was sent (or printed in dry-run mode).
+    """
     if not webhook_url:
         print('--- Slack Payload (dry run) ---')
         print(text)
         print('-------------------------------')
-        return
-
-    resp = requests.post(webhook_url, json={'text': text}, timeout=30)
+        return True
+
+    text_hash = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+    if last_hash_path:
+        try:
+            with open(last_hash_path, 'r', encoding='utf-8') as f:
+                if f.read().strip() == text_hash:
+                    return False
+        except OSError:
+            pass
+
+    resp = SESSION.post(webhook_url, json={'text': text}, timeout=30)
     if resp.status_code != 200:
         raise RuntimeError(f'Slack webhook failed: {resp.status_code} {resp.text}')
 
+    if last_hash_path:
+        try:
+            with open(last_hash_path, 'w', encoding='utf-8') as f:
+                f.write(text_hash)
+        except OSError:
+            pass
+    return True
+
 
 def main():
     token = env('PIPEDRIVE_API_TOKEN', required=True)
@@ -128,10 +234,13 @@ def main():
     webhook_url = env('SLACK_WEBHOOK_URL', '')
     stage_name = env('AGENT_READY_STAGE_NAME', 'agent調整完了')
     owner_map_path = env('OWNER_SLACK_MAP_PATH', 'config/owner_slack_map.yaml')
+    stage_id_cache_path = env('STAGE_ID_CACHE_PATH', 'config/.stage_id_cache.json')
+    last_hash_path = env('LAST_SLACK_HASH_PATH', 'config/.last_slack_hash')
 
     owner_map = load_owner_map(owner_map_path)
-    stage_id = find_stage_id(stage_name, pipeline_id, token)
-    deals = fetch_deals(pipeline_id, stage_id, token)
+    stage_id = resolve_stage_id(stage_name, pipeline_id, token, stage_id_cache_path)
+    # Only the first deal is posted, so don't page in the rest.
+    deals = fetch_deals(pipeline_id, stage_id, token, limit=1)
 
     if not deals:
         print(f'No deals found in stage "{stage_name}".')
@@ -147,8 +256,10 @@ def main():
         f'担当: {owner_label}'
     ])
 
-    post_to_slack(webhook_url, text)
-    print(f'Posted deal "{title}" to Slack.')
+    if post_to_slack(webhook_url, text, last_hash_path):
+        print(f'Posted deal "{title}" to Slack.')
+    else:
+        print(f'Deal "{title}" was already posted; skipped.')
 
 
 if __name__ == '__main__':